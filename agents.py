@@ -2,23 +2,48 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+import httpx
 from crewai import Agent
-from langchain_openai import ChatOpenAI
+from llm_cache import CachedChatOpenAI
 from tools import search_tool, blood_test_tool, nutrition_tool, exercise_tool
 
-# Initialize LLM
-llm = ChatOpenAI(
+# Verbose step logging and per-turn memory writes (embedding calls into the
+# vector store) are development aids with real per-step cost, so both default
+# off in production and are switched on via env when debugging.
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "0") == "1"
+AGENT_MEMORY = os.getenv("AGENT_MEMORY", "0") == "1"
+
+# All agents share one HTTP/2 connection pool to api.openai.com, so
+# concurrent LLM calls multiplex over a few warm connections instead of
+# paying a TLS handshake per call
+_openai_limits = httpx.Limits(max_keepalive_connections=100, max_connections=200)
+_openai_http_client = httpx.Client(http2=True, timeout=60.0, limits=_openai_limits)
+_openai_http_async_client = httpx.AsyncClient(http2=True, timeout=60.0, limits=_openai_limits)
+
+_llm_kwargs = dict(
     model="gpt-3.5-turbo",
-    temperature=0.1,
-    api_key=os.getenv("OPENAI_API_KEY")
+    temperature=0,
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=_openai_http_client,
+    http_async_client=_openai_http_async_client,
 )
 
+# Initialize LLM with Redis response caching (temperature 0 so identical
+# calls are deterministic enough to reuse). With LLM_BATCHER_ENABLED=true
+# and the llm_batcher.py sidecar running, calls from concurrent workers
+# are coalesced into micro-batches on a single OpenAI client.
+if os.getenv("LLM_BATCHER_ENABLED", "false").lower() == "true":
+    from llm_batcher import BatchedChatOpenAI
+    llm = BatchedChatOpenAI(**_llm_kwargs)
+else:
+    llm = CachedChatOpenAI(**_llm_kwargs)
+
 # Creating a Medical Analysis Agent
 medical_doctor = Agent(
     role="Experienced Medical Doctor and Blood Test Specialist",
     goal="Analyze blood test reports accurately and provide professional medical insights for the user query: {query}",
-    verbose=True,
-    memory=True,
+    verbose=AGENT_VERBOSE,
+    memory=AGENT_MEMORY,
     backstory=(
         "You are an experienced medical doctor with 15+ years of experience in laboratory medicine "
         "and blood test interpretation. You specialize in analyzing blood work and identifying "
@@ -33,12 +58,34 @@ medical_doctor = Agent(
     allow_delegation=True
 )
 
+# Solo variant of the medical doctor for single-agent crews: with no peers
+# to delegate to, delegation prompts and extra iterations are wasted LLM
+# round-trips, so cap at two iterations (one tool round plus the answer)
+medical_doctor_solo = Agent(
+    role="Experienced Medical Doctor and Blood Test Specialist",
+    goal="Analyze blood test reports accurately and provide professional medical insights for the user query: {query}",
+    verbose=AGENT_VERBOSE,
+    memory=AGENT_MEMORY,
+    backstory=(
+        "You are an experienced medical doctor with 15+ years of experience in laboratory medicine "
+        "and blood test interpretation. You specialize in analyzing blood work and identifying "
+        "potential health concerns based on laboratory values. You always provide accurate, "
+        "evidence-based medical information while emphasizing the importance of consulting "
+        "with healthcare providers for proper diagnosis and treatment. You are thorough, "
+        "professional, and prioritize patient safety in all recommendations."
+    ),
+    tools=[blood_test_tool, search_tool],
+    llm=llm,
+    max_iter=2,
+    allow_delegation=False
+)
+
 # Creating a Blood Report Verification Agent
 verifier_agent = Agent(
     role="Medical Document Verifier",
     goal="Verify that uploaded documents are valid blood test reports and extract relevant medical information",
-    verbose=True,
-    memory=True,
+    verbose=AGENT_VERBOSE,
+    memory=AGENT_MEMORY,
     backstory=(
         "You are a medical records specialist with expertise in identifying and validating "
         "various types of medical documents, particularly blood test reports. You have keen "
@@ -56,8 +103,8 @@ verifier_agent = Agent(
 nutrition_specialist = Agent(
     role="Clinical Nutritionist and Dietitian",
     goal="Provide evidence-based nutritional recommendations based on blood test results",
-    verbose=True,
-    memory=True,
+    verbose=AGENT_VERBOSE,
+    memory=AGENT_MEMORY,
     backstory=(
         "You are a certified clinical nutritionist with a master's degree in nutrition science "
         "and 10+ years of experience working with patients. You specialize in interpreting "
@@ -76,8 +123,8 @@ nutrition_specialist = Agent(
 exercise_specialist = Agent(
     role="Exercise Physiologist and Fitness Specialist",
     goal="Develop safe and effective exercise recommendations based on blood test results and health status",
-    verbose=True,
-    memory=True,
+    verbose=AGENT_VERBOSE,
+    memory=AGENT_MEMORY,
     backstory=(
         "You are a certified exercise physiologist with expertise in designing exercise programs "
         "for individuals with various health conditions. You understand how different health "
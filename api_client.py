@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+from typing import List, Optional
+
+import httpx
+
+# One AsyncClient per base_url, shared across client instances, so TCP/TLS
+# connections stay warm and keep-alive amortizes handshakes - this matters
+# most for the wait_for_task polling fallback.
+_shared_clients = {}
+
+def _get_shared_client(base_url: str) -> httpx.AsyncClient:
+    client = _shared_clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=None,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        )
+        _shared_clients[base_url] = client
+    return client
+
+
+class BloodTestAnalyzerClient:
+    """
+    Async client for the Blood Test Report Analyzer API.
+
+    Built on httpx.AsyncClient so a batch of report uploads can run
+    concurrently instead of being serialized behind blocking requests.
+    Use analyze_many() to fan out N uploads with asyncio.gather, or the
+    *_sync wrappers for simple scripts.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000"):
+        self.base_url = base_url
+        self._client = _get_shared_client(base_url)
+
+    async def close(self):
+        """Close the shared HTTP client for this base_url"""
+        _shared_clients.pop(self.base_url, None)
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def analyze_sync(self, file_path: str, query: str = "Summarize my blood test report") -> dict:
+        """Upload a report and wait for the synchronous analysis result"""
+        with open(file_path, "rb") as f:
+            response = await self._client.post(
+                "/analyze",
+                files={"file": (os.path.basename(file_path), f, "application/pdf")},
+                data={"query": query, "async_processing": "false"}
+            )
+        response.raise_for_status()
+        return response.json()
+
+    async def analyze_async(self, file_path: str, query: str = "Summarize my blood test report") -> dict:
+        """Upload a report for async processing and return the task info"""
+        with open(file_path, "rb") as f:
+            response = await self._client.post(
+                "/analyze",
+                files={"file": (os.path.basename(file_path), f, "application/pdf")},
+                data={"query": query, "async_processing": "true"}
+            )
+        response.raise_for_status()
+        return response.json()
+
+    async def comprehensive_analysis(self, file_path: str,
+                                     query: str = "Provide comprehensive analysis with nutrition and exercise recommendations") -> dict:
+        """Start a comprehensive analysis with all specialists"""
+        with open(file_path, "rb") as f:
+            response = await self._client.post(
+                "/analyze/comprehensive",
+                files={"file": (os.path.basename(file_path), f, "application/pdf")},
+                data={"query": query}
+            )
+        response.raise_for_status()
+        return response.json()
+
+    async def get_task_status(self, task_id: str) -> dict:
+        """Get the current status of an async task"""
+        response = await self._client.get(f"/task/{task_id}")
+        response.raise_for_status()
+        return response.json()
+
+    async def wait_for_task(self, task_id: str, poll_interval: float = 5.0,
+                            timeout: Optional[float] = None) -> dict:
+        """
+        Wait for a task to finish. Uses the server's /task/{id}/wait SSE
+        endpoint so completion is signaled immediately with a single
+        request; falls back to exponential-backoff polling if the stream
+        is unavailable.
+        """
+        try:
+            params = {"timeout": int(timeout)} if timeout is not None else {}
+            async with self._client.stream("GET", f"/task/{task_id}/wait", params=params) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        status = json.loads(line[len("data: "):])
+                        if status["status"] == "timeout":
+                            raise TimeoutError(f"Task {task_id} did not complete within {timeout} seconds")
+                        return status
+        except (httpx.HTTPError, json.JSONDecodeError):
+            pass
+
+        # Fallback: poll with exponential backoff up to poll_interval
+        delay = 1.0
+        elapsed = 0.0
+        while True:
+            status = await self.get_task_status(task_id)
+            if status["status"] in ("completed", "failed"):
+                return status
+            if timeout is not None and elapsed >= timeout:
+                raise TimeoutError(f"Task {task_id} did not complete within {timeout} seconds")
+            await asyncio.sleep(delay)
+            elapsed += delay
+            delay = min(delay * 2, poll_interval)
+
+    async def analyze_many(self, file_paths: List[str],
+                           query: str = "Summarize my blood test report") -> List[dict]:
+        """Fire N async uploads concurrently and return all task infos"""
+        return await asyncio.gather(
+            *[self.analyze_async(path, query) for path in file_paths]
+        )
+
+    # Thin sync facade for scripts that are not running an event loop
+
+    def analyze_sync_blocking(self, file_path: str, query: str = "Summarize my blood test report") -> dict:
+        return asyncio.run(self.analyze_sync(file_path, query))
+
+    def analyze_many_blocking(self, file_paths: List[str],
+                              query: str = "Summarize my blood test report") -> List[dict]:
+        return asyncio.run(self.analyze_many(file_paths, query))
+
+
+async def main():
+    """Example: analyze a batch of reports concurrently"""
+    async with BloodTestAnalyzerClient() as client:
+        tasks = await client.analyze_many(["data/sample.pdf", "data/blood_test_report.pdf"])
+        results = await asyncio.gather(
+            *[client.wait_for_task(t["task_id"]) for t in tasks]
+        )
+        for result in results:
+            print(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
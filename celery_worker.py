@@ -1,15 +1,35 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from celery import Celery
+from celery.utils.log import get_task_logger
+from kombu import Exchange, Queue
 from dotenv import load_dotenv
 from crewai import Crew, Process
-from agents import medical_doctor, nutrition_specialist, exercise_specialist, verifier_agent
-from tasks import help_patients_task, verification_task, medical_analysis_task, nutrition_analysis_task, exercise_planning_task
-from database import SessionLocal, BloodAnalysis
+from agents import medical_doctor, medical_doctor_solo, nutrition_specialist, exercise_specialist, verifier_agent, AGENT_VERBOSE
+from tasks import (
+    help_patients_task,
+    build_verification_task,
+    build_medical_analysis_task,
+    build_medical_analysis_cached_task,
+    build_nutrition_analysis_task,
+    build_exercise_planning_task,
+)
+from tools import blood_test_tool
+import report_cache
+from database import save_analysis, init_db
+from llm_cache import get_redis_client, analysis_cache_key, ANALYSIS_CACHE_TTL_SECONDS
 from datetime import datetime
+import json
 
 load_dotenv()
 
+logger = get_task_logger(__name__)
+
+# Workers can write results before any API process has started, so make
+# sure the tables and the aggregates row exist here too (idempotent)
+init_db()
+
 # Initialize Celery
 celery_app = Celery(
     "blood_analysis_worker",
@@ -24,10 +44,84 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     result_expires=3600,
+    # Analysis results are large text blobs; gzip them on the wire and in
+    # the result backend
+    task_compression="gzip",
+    result_compression="gzip",
+    # Short analyses and multi-minute comprehensive runs go to separate
+    # queues so a burst of comprehensive jobs never starves quick ones;
+    # each queue gets its own worker pool (see docker-compose.yml)
+    task_default_queue="analyze",
+    # Transient queues: the database row is the durable record and a lost
+    # message can simply be resubmitted by the client, so skip per-message
+    # persistence on the broker and the disk sync it costs per enqueue
+    task_queues=(
+        Queue("analyze", Exchange("analyze", delivery_mode=1),
+              routing_key="analyze", durable=False),
+        Queue("comprehensive", Exchange("comprehensive", delivery_mode=1),
+              routing_key="comprehensive", durable=False),
+    ),
+    task_routes={
+        "celery_worker.analyze_blood_report_task": {"queue": "analyze"},
+        "celery_worker.comprehensive_analysis_task": {"queue": "comprehensive"},
+    },
+    # Tasks run for minutes, so the default prefetch of 4x hoards jobs at
+    # one worker while others idle. Prefetch one at a time and only ack
+    # after completion; a task whose worker dies goes back on the queue.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Recycle worker processes periodically to bound RSS growth from the
+    # LLM client and crew state
+    worker_max_tasks_per_child=50,
+)
+
+# This crew is shared across tasks: construction validates agents and wires
+# tools, which is pure overhead when repeated per task. Safe only because
+# the analyze queue runs on prefork, where each worker process executes one
+# task at a time - kickoff mutates Task state in place, so the gevent-pooled
+# comprehensive path below builds its tasks and crews per run instead.
+MEDICAL_CREW = Crew(
+    agents=[medical_doctor_solo],
+    tasks=[help_patients_task],
+    process=Process.sequential,
+    verbose=AGENT_VERBOSE
 )
 
+# The comprehensive pipeline is a small DAG rather than a flat sequence:
+#
+#   verification -> medical -> {nutrition, exercise}
+#
+# ANALYSIS_CREW covers the dependent spine; the two independent leaf
+# branches fan out concurrently below.
+
+def _run_specialist_branches(crew_inputs):
+    """Run the independent nutrition and exercise branches of the DAG
+    concurrently. Threads work under both worker pools: prefork gets real
+    threads, and gevent's monkey patching turns them into greenlets -
+    unlike asyncio.run, which raises when overlapping gevent tasks each
+    try to start an event loop in the pool's shared thread. Each branch
+    gets its own task and crew, since overlapping runs must not share
+    mutable Task state."""
+    nutrition_crew = Crew(
+        agents=[nutrition_specialist],
+        tasks=[build_nutrition_analysis_task()],
+        process=Process.sequential,
+        verbose=AGENT_VERBOSE
+    )
+    exercise_crew = Crew(
+        agents=[exercise_specialist],
+        tasks=[build_exercise_planning_task()],
+        process=Process.sequential,
+        verbose=AGENT_VERBOSE
+    )
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        nutrition = pool.submit(nutrition_crew.kickoff, inputs=crew_inputs)
+        exercise = pool.submit(exercise_crew.kickoff, inputs=crew_inputs)
+        return nutrition.result(), exercise.result()
+
 @celery_app.task(bind=True)
-def analyze_blood_report_task(self, query: str, file_path: str, filename: str):
+def analyze_blood_report_task(self, query: str, file_path: str, filename: str, file_hash: str = None):
     """
     Celery task to analyze blood test report
     """
@@ -35,80 +129,72 @@ def analyze_blood_report_task(self, query: str, file_path: str, filename: str):
     
     try:
         # Update task status
-        self.update_state(state='PROGRESS', meta={'status': 'Starting analysis...', 'file_path': file_path})
-        
-        # Debug: Log file path and check existence
-        print(f"Celery worker: Processing file at path: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
+        self.update_state(state='PROGRESS', meta={'status': 'Starting analysis...'})
         
-        # Verify file exists with detailed error reporting
-        if not os.path.exists(file_path):
-            # Try to list files in the directory to help with debugging
+        # Debug: Log file path
+        logger.info("Processing file at path: %s", file_path)
+
+        # One stat call covers both the existence and empty-file checks
+        try:
+            file_size = os.stat(file_path).st_size
+        except FileNotFoundError:
+            # List the directory to help with debugging
             dir_path = os.path.dirname(file_path)
             if os.path.exists(dir_path):
                 files_in_dir = os.listdir(dir_path)
                 error_msg = f"File not found at path: {file_path}. Files in directory {dir_path}: {files_in_dir}"
             else:
                 error_msg = f"File not found at path: {file_path}. Directory {dir_path} does not exist."
-            
-            print(error_msg)
+
+            logger.error(error_msg)
             raise Exception(error_msg)
-        
-        # Check file size
-        file_size = os.path.getsize(file_path)
-        print(f"File size: {file_size} bytes")
-        
+
+        logger.info("File size: %s bytes", file_size)
+
         if file_size == 0:
             raise Exception(f"File at {file_path} is empty")
         
-        # Create medical analysis crew
-        medical_crew = Crew(
-            agents=[medical_doctor],
-            tasks=[help_patients_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        
         # Update status
         self.update_state(state='PROGRESS', meta={'status': 'Running medical analysis...', 'file_size': file_size})
-        
+
+        # Parse the PDF once up front so the agent works on plain text
+        # instead of re-invoking the PDF tool; reuse a previous extraction
+        # of the same file when one is cached
+        content_hash = report_cache.file_content_hash(file_path)
+        report_text = report_cache.get_parsed_text(content_hash)
+        if report_text is None:
+            report_text = blood_test_tool._run(file_path)
+            if not report_text.startswith("Error"):
+                report_cache.store_parsed_text(content_hash, report_text)
+
         # Execute the crew with file_path in context
-        result = medical_crew.kickoff({
+        result = MEDICAL_CREW.kickoff({
             'query': query,
-            'file_path': file_path
+            'file_path': file_path,
+            'report_text': report_text
         })
         
         # Calculate processing time
         processing_time = time.time() - start_time
         
         # Save to database
-        db = SessionLocal()
-        try:
-            analysis = BloodAnalysis(
-                filename=filename,
-                query=query,
-                analysis_result=str(result),
-                processing_time=processing_time,
-                status="completed"
-            )
-            db.add(analysis)
-            db.commit()
-            analysis_id = analysis.id
-        except Exception as db_error:
-            print(f"Database error: {db_error}")
-            analysis_id = None
-        finally:
-            db.close()
-        
+        analysis_id = save_analysis(
+            filename=filename,
+            query=query,
+            analysis_result=str(result),
+            processing_time=processing_time,
+            status="completed"
+        )
+
         # Clean up the uploaded file after processing
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Successfully cleaned up file: {file_path}")
+                logger.info("Cleaned up file: %s", file_path)
         except Exception as cleanup_error:
-            print(f"Warning: Could not clean up file {file_path}: {cleanup_error}")
-        
-        return {
+            logger.warning("Could not clean up file %s: %s", file_path, cleanup_error)
+
+        task_result = {
             "status": "success",
             "query": query,
             "analysis": str(result),
@@ -116,35 +202,40 @@ def analyze_blood_report_task(self, query: str, file_path: str, filename: str):
             "processing_time": processing_time,
             "analysis_id": analysis_id
         }
-        
+
+        # Store for the /analyze cache fastpath on repeat uploads
+        if file_hash:
+            try:
+                get_redis_client().setex(
+                    analysis_cache_key(file_hash, query),
+                    ANALYSIS_CACHE_TTL_SECONDS,
+                    json.dumps(task_result)
+                )
+            except Exception as cache_error:
+                logger.warning("Could not cache analysis result: %s", cache_error)
+
+        return task_result
+
     except Exception as e:
         error_message = str(e)
-        print(f"Error in analyze_blood_report_task: {error_message}")
-        
+        logger.error("Error in analyze_blood_report_task: %s", error_message)
+
         # Save error to database
-        db = SessionLocal()
-        try:
-            analysis = BloodAnalysis(
-                filename=filename,
-                query=query,
-                analysis_result=f"Error: {error_message}",
-                processing_time=time.time() - start_time,
-                status="failed"
-            )
-            db.add(analysis)
-            db.commit()
-        except Exception as db_error:
-            print(f"Database error while saving failure: {db_error}")
-        finally:
-            db.close()
-        
+        save_analysis(
+            filename=filename,
+            query=query,
+            analysis_result=f"Error: {error_message}",
+            processing_time=time.time() - start_time,
+            status="failed"
+        )
+
         # Clean up the uploaded file even on error
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Cleaned up file after error: {file_path}")
+                logger.info("Cleaned up file after error: %s", file_path)
         except Exception as cleanup_error:
-            print(f"Could not clean up file after error: {cleanup_error}")
+            logger.warning("Could not clean up file after error: %s", cleanup_error)
             
         return {
             "status": "error",
@@ -161,78 +252,113 @@ def comprehensive_analysis_task(self, query: str, file_path: str, filename: str)
     
     try:
         # Update task status
-        self.update_state(state='PROGRESS', meta={'status': 'Starting comprehensive analysis...', 'file_path': file_path})
-        
-        # Debug: Log file path and check existence
-        print(f"Comprehensive analysis: Processing file at path: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
+        self.update_state(state='PROGRESS', meta={'status': 'Starting comprehensive analysis...'})
         
-        # Verify file exists with detailed error reporting
-        if not os.path.exists(file_path):
-            # Try to list files in the directory to help with debugging
+        # Debug: Log file path
+        logger.info("Comprehensive analysis: processing file at path: %s", file_path)
+
+        # One stat call covers both the existence and empty-file checks
+        try:
+            file_size = os.stat(file_path).st_size
+        except FileNotFoundError:
+            # List the directory to help with debugging
             dir_path = os.path.dirname(file_path)
             if os.path.exists(dir_path):
                 files_in_dir = os.listdir(dir_path)
                 error_msg = f"File not found at path: {file_path}. Files in directory {dir_path}: {files_in_dir}"
             else:
                 error_msg = f"File not found at path: {file_path}. Directory {dir_path} does not exist."
-            
-            print(error_msg)
+
+            logger.error(error_msg)
             raise Exception(error_msg)
-        
-        # Check file size
-        file_size = os.path.getsize(file_path)
-        print(f"File size: {file_size} bytes")
-        
+
+        logger.info("File size: %s bytes", file_size)
+
         if file_size == 0:
             raise Exception(f"File at {file_path} is empty")
         
-        # Create comprehensive crew with all specialists
-        comprehensive_crew = Crew(
-            agents=[verifier_agent, medical_doctor, nutrition_specialist, exercise_specialist],
-            tasks=[verification_task, medical_analysis_task, nutrition_analysis_task, exercise_planning_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        # Update status
-        self.update_state(state='PROGRESS', meta={'status': 'Running comprehensive analysis with all specialists...', 'file_size': file_size})
-        
-        # Execute the crew with file_path in context
-        result = comprehensive_crew.kickoff({
+        # Parse the PDF once up front - all four agents previously
+        # re-invoked the PDF tool on the same file. Both the extracted text
+        # and the verifier output are reused across task types when the
+        # same file was analyzed before.
+        content_hash = report_cache.file_content_hash(file_path)
+        report_text = report_cache.get_parsed_text(content_hash)
+        if report_text is None:
+            report_text = blood_test_tool._run(file_path)
+            if not report_text.startswith("Error"):
+                report_cache.store_parsed_text(content_hash, report_text)
+
+        verification_result = report_cache.get_verification(content_hash)
+
+        crew_inputs = {
             'query': query,
-            'file_path': file_path
-        })
+            'file_path': file_path,
+            'report_text': report_text,
+            'verification_result': verification_result or ''
+        }
+
+        # Stage 1: verification and medical analysis depend on each other, so they run sequentially.
+        # A cached verifier output for this exact file lets us skip the verifier turn entirely.
+        # Tasks and crews are built per run: concurrent gevent tasks would
+        # otherwise interleave on shared Task state, e.g. caching one
+        # patient's verification text under another's content hash.
+        if verification_result:
+            self.update_state(state='PROGRESS', meta={'status': 'Running medical analysis (verification cached)...', 'file_size': file_size})
+            followup_crew = Crew(
+                agents=[medical_doctor],
+                tasks=[build_medical_analysis_cached_task()],
+                process=Process.sequential,
+                verbose=AGENT_VERBOSE
+            )
+            medical_result = followup_crew.kickoff(crew_inputs)
+        else:
+            self.update_state(state='PROGRESS', meta={'status': 'Running verification and medical analysis...', 'file_size': file_size})
+            verification = build_verification_task()
+            analysis_crew = Crew(
+                agents=[verifier_agent, medical_doctor],
+                tasks=[verification, build_medical_analysis_task(verification)],
+                process=Process.sequential,
+                verbose=AGENT_VERBOSE
+            )
+            medical_result = analysis_crew.kickoff(crew_inputs)
+            try:
+                report_cache.store_verification(content_hash, str(verification.output))
+            except Exception as cache_error:
+                logger.warning("Could not cache verification result: %s", cache_error)
+
+        # Stage 2: nutrition and exercise only depend on the medical summary,
+        # which they receive as an explicit input, so run them concurrently
+        self.update_state(state='PROGRESS', meta={'status': 'Running nutrition and exercise specialists concurrently...', 'file_size': file_size})
+
+        specialist_inputs = {**crew_inputs, 'medical_summary': str(medical_result)}
+        nutrition_result, exercise_result = _run_specialist_branches(specialist_inputs)
+
+        # Combine the three stage outputs into a single report
+        result = (
+            f"{medical_result}\n\n"
+            f"NUTRITION RECOMMENDATIONS:\n{nutrition_result}\n\n"
+            f"EXERCISE PLAN:\n{exercise_result}"
+        )
         
         # Calculate processing time
         processing_time = time.time() - start_time
         
         # Save to database
-        db = SessionLocal()
-        try:
-            analysis = BloodAnalysis(
-                filename=filename,
-                query=f"Comprehensive: {query}",
-                analysis_result=str(result),
-                processing_time=processing_time,
-                status="completed"
-            )
-            db.add(analysis)
-            db.commit()
-            analysis_id = analysis.id
-        except Exception as db_error:
-            print(f"Database error: {db_error}")
-            analysis_id = None
-        finally:
-            db.close()
-        
+        analysis_id = save_analysis(
+            filename=filename,
+            query=f"Comprehensive: {query}",
+            analysis_result=str(result),
+            processing_time=processing_time,
+            status="completed"
+        )
+
         # Clean up the uploaded file after processing
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Successfully cleaned up file: {file_path}")
+                logger.info("Cleaned up file: %s", file_path)
         except Exception as cleanup_error:
-            print(f"Warning: Could not clean up file {file_path}: {cleanup_error}")
+            logger.warning("Could not clean up file %s: %s", file_path, cleanup_error)
         
         return {
             "status": "success",
@@ -246,32 +372,24 @@ def comprehensive_analysis_task(self, query: str, file_path: str, filename: str)
         
     except Exception as e:
         error_message = str(e)
-        print(f"Error in comprehensive_analysis_task: {error_message}")
+        logger.error("Error in comprehensive_analysis_task: %s", error_message)
         
         # Save error to database
-        db = SessionLocal()
-        try:
-            analysis = BloodAnalysis(
-                filename=filename,
-                query=f"Comprehensive: {query}",
-                analysis_result=f"Error: {error_message}",
-                processing_time=time.time() - start_time,
-                status="failed"
-            )
-            db.add(analysis)
-            db.commit()
-        except Exception as db_error:
-            print(f"Database error while saving failure: {db_error}")
-        finally:
-            db.close()
-        
+        save_analysis(
+            filename=filename,
+            query=f"Comprehensive: {query}",
+            analysis_result=f"Error: {error_message}",
+            processing_time=time.time() - start_time,
+            status="failed"
+        )
+
         # Clean up the uploaded file even on error
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Cleaned up file after error: {file_path}")
+                logger.info("Cleaned up file after error: %s", file_path)
         except Exception as cleanup_error:
-            print(f"Could not clean up file after error: {cleanup_error}")
+            logger.warning("Could not clean up file after error: %s", cleanup_error)
             
         return {
             "status": "error",
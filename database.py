@@ -1,50 +1,208 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, update, case, Column, Integer, String, Text, DateTime, Float, Index, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./blood_analysis.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+if "sqlite" in DATABASE_URL:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+else:
+    # Keep a pool of warm connections instead of reconnecting per task
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        insertmanyvalues_page_size=1000,
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The API runs on the event loop, where a sync Session would block every
+# other request for the duration of each query. FastAPI endpoints use this
+# async engine; Celery workers stay on the sync engine above.
+if "sqlite" in DATABASE_URL:
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+else:
+    ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=20,
+        max_overflow=40,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
 Base = declarative_base()
 
 class BloodAnalysis(Base):
     __tablename__ = "blood_analyses"
+    __table_args__ = (
+        Index("ix_blood_status_created", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     query = Column(Text, nullable=False)
     analysis_result = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # The Python-side default stays alongside server_default: create_all
+    # never alters pre-existing tables, so databases created before the
+    # server default existed would otherwise insert NULL timestamps
+    created_at = Column(DateTime(timezone=True),
+                        default=lambda: datetime.now(timezone.utc),
+                        server_default=func.now(), index=True)
     processing_time = Column(Float, nullable=True)
-    status = Column(String, default="completed")
+    status = Column(String, default="completed", index=True)
+
+# History pages scan newest-first; a descending composite index lets keyset
+# pagination walk the index directly instead of sorting per request
+Index("ix_ba_created_id", BloodAnalysis.created_at.desc(), BloodAnalysis.id.desc())
+
+class AnalysisStats(Base):
+    """Single row of running aggregates over blood_analyses, updated in the
+    same transaction as each insert so /stats never scans the table"""
+    __tablename__ = "analysis_stats"
+
+    id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    time_sum = Column(Float, nullable=False, default=0.0)
+
+def stats_adjust(status, processing_time, delta=1):
+    """Update statement folding one analysis row into the aggregates;
+    delta=-1 removes it again (e.g. on delete)"""
+    is_completed = status == "completed"
+    return update(AnalysisStats).where(AnalysisStats.id == 1).values(
+        total=AnalysisStats.total + delta,
+        completed=AnalysisStats.completed + (delta if is_completed else 0),
+        failed=AnalysisStats.failed + (delta if status == "failed" else 0),
+        time_sum=AnalysisStats.time_sum + (
+            delta * processing_time if is_completed and processing_time else 0.0
+        ),
+    )
 
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True),
+                        default=lambda: datetime.now(timezone.utc),
+                        server_default=func.now())
     total_analyses = Column(Integer, default=0)
 
 def create_tables():
-    """Create database tables"""
+    """Create database tables and indexes"""
     Base.metadata.create_all(bind=engine)
 
-def get_db():
-    """Database session dependency"""
+    # create_all does not add indexes to pre-existing tables, so create
+    # them explicitly for databases initialized before the indexes existed
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_blood_analyses_created_at "
+            "ON blood_analyses (created_at)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_blood_analyses_status "
+            "ON blood_analyses (status)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_blood_status_created "
+            "ON blood_analyses (status, created_at)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_ba_created_id "
+            "ON blood_analyses (created_at DESC, id DESC)"
+        ))
+        if "sqlite" in DATABASE_URL:
+            # Refresh planner statistics so sqlite actually uses the indexes
+            conn.execute(text("ANALYZE"))
+        conn.commit()
+
+    bootstrap_stats_row()
+
+def bootstrap_stats_row():
+    """Create and backfill the aggregates row if it does not exist yet;
+    after that it is maintained incrementally alongside every insert.
+    Safe to run from several processes at once (multiple uvicorn workers,
+    Celery workers): the loser of the insert race hits the primary key
+    constraint and the row is simply there already."""
+    try:
+        with db_session() as db:
+            if db.get(AnalysisStats, 1) is not None:
+                return
+            total, completed, failed, time_sum = db.query(
+                func.count(BloodAnalysis.id),
+                func.count(case((BloodAnalysis.status == "completed", 1))),
+                func.count(case((BloodAnalysis.status == "failed", 1))),
+                func.coalesce(func.sum(case(
+                    (BloodAnalysis.status == "completed", BloodAnalysis.processing_time)
+                )), 0.0),
+            ).one()
+            db.add(AnalysisStats(id=1, total=total, completed=completed,
+                                 failed=failed, time_sum=time_sum))
+    except IntegrityError:
+        pass
+
+async def get_db():
+    """Async database session dependency for FastAPI endpoints"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@contextmanager
+def db_session():
+    """Session scope that commits on success, rolls back on error and
+    always returns the connection to the pool"""
     db = SessionLocal()
     try:
         yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
+def save_analysis(filename, query, analysis_result, processing_time, status):
+    """Persist one analysis row and return its id, or None on database error"""
+    try:
+        with db_session() as db:
+            analysis = BloodAnalysis(
+                filename=filename,
+                query=query,
+                analysis_result=analysis_result,
+                processing_time=processing_time,
+                status=status
+            )
+            db.add(analysis)
+            if db.execute(stats_adjust(status, processing_time)).rowcount == 0:
+                # No aggregates row yet (fresh database written to before
+                # any bootstrap ran) - seed it with this row's contribution
+                is_completed = status == "completed"
+                db.add(AnalysisStats(
+                    id=1,
+                    total=1,
+                    completed=1 if is_completed else 0,
+                    failed=1 if status == "failed" else 0,
+                    time_sum=processing_time if is_completed and processing_time else 0.0,
+                ))
+            db.flush()
+            return analysis.id
+    except Exception as db_error:
+        print(f"Database error: {db_error}")
+        return None
+
 def init_db():
     """Initialize database"""
     create_tables()
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import Any, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import redis
+from openai import AsyncOpenAI
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm_cache import CachedChatOpenAI, get_redis_client
+
+# Redis stream the workers publish pending completions to
+PENDING_STREAM = "llm:pending"
+RESULT_KEY = "llm:result:{}"
+
+# Refreshed by the sidecar every loop iteration; submitters fall back to
+# the direct API immediately while it is absent instead of waiting out the
+# full result timeout
+HEARTBEAT_KEY = "llm:batcher:alive"
+HEARTBEAT_TTL_SECONDS = 10
+
+BATCH_MAX_SIZE = 32
+BATCH_WINDOW_MS = 100
+RESULT_TTL_SECONDS = 300
+WAIT_TIMEOUT_SECONDS = 120
+
+# Caps the pending stream so abandoned entries cannot grow Redis without
+# bound; far above anything BATCH_MAX_SIZE-sized batches leave behind
+PENDING_MAXLEN = 10000
+
+_ROLE_MAP = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+def _to_openai_messages(messages: List[BaseMessage]) -> List[dict]:
+    """Convert LangChain messages to OpenAI chat format"""
+    return [
+        {"role": _ROLE_MAP.get(m.type, "user"), "content": m.content}
+        for m in messages
+    ]
+
+
+def submit_request(model: str, messages: List[dict], temperature: float) -> str:
+    """Publish one chat completion request to the batching stream"""
+    future_id = str(uuid.uuid4())
+    get_redis_client().xadd(PENDING_STREAM, {
+        "future_id": future_id,
+        "payload": json.dumps({
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+        }),
+    }, maxlen=PENDING_MAXLEN, approximate=True)
+    return future_id
+
+
+def wait_for_result(future_id: str, timeout: int = WAIT_TIMEOUT_SECONDS) -> str:
+    """Block until the batcher pushes the completion for future_id"""
+    item = get_redis_client().blpop(RESULT_KEY.format(future_id), timeout=timeout)
+    if item is None:
+        raise TimeoutError(f"No batcher response for request {future_id} within {timeout} seconds")
+
+    data = json.loads(item[1])
+    if "error" in data:
+        raise RuntimeError(f"Batched completion failed: {data['error']}")
+    return data["content"]
+
+
+class BatchedChatOpenAI(CachedChatOpenAI):
+    """
+    ChatOpenAI that routes completions through the micro-batching sidecar.
+
+    Calls from concurrent Celery workers land on the llm:pending stream,
+    the sidecar coalesces them into micro-batches and fans them out on a
+    single AsyncOpenAI client, and each caller blocks on its own result
+    key. Cache hits are still served locally; if the batcher is down or
+    slow, calls fall back to the OpenAI API directly.
+    """
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key = self._cache_key(messages)
+        if self._cache_enabled():
+            cached = self._get_cached(key)
+            if cached is not None:
+                return cached
+
+        try:
+            # A dead sidecar would otherwise stall every call for the full
+            # result timeout before falling back
+            if not get_redis_client().exists(HEARTBEAT_KEY):
+                raise RuntimeError("batcher heartbeat missing")
+            future_id = submit_request(
+                self.model_name, _to_openai_messages(messages), self.temperature or 0
+            )
+            content = wait_for_result(future_id)
+            result = ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+        except (redis.RedisError, TimeoutError, RuntimeError) as e:
+            print(f"LLM batcher unavailable, calling API directly: {e}")
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        if self._cache_enabled():
+            self._store_result(key, result)
+        return result
+
+
+async def _complete_one(client: AsyncOpenAI, r: "redis.Redis", fields: dict) -> None:
+    """Run one completion from the batch and push its result"""
+    future_id = fields[b"future_id"].decode()
+    payload = json.loads(fields[b"payload"])
+
+    try:
+        response = await client.chat.completions.create(
+            model=payload["model"],
+            messages=payload["messages"],
+            temperature=payload["temperature"],
+        )
+        data = {"content": response.choices[0].message.content}
+    except Exception as e:
+        data = {"error": str(e)}
+
+    pipe = r.pipeline()
+    pipe.rpush(RESULT_KEY.format(future_id), json.dumps(data))
+    pipe.expire(RESULT_KEY.format(future_id), RESULT_TTL_SECONDS)
+    pipe.execute()
+
+
+async def run_batcher():
+    """
+    Sidecar loop: pop up to BATCH_MAX_SIZE pending requests or wait
+    BATCH_WINDOW_MS, whichever comes first, then fan the batch out
+    concurrently on a single AsyncOpenAI client.
+    """
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    r = get_redis_client()
+    # Start far enough back to cover requests enqueued while the sidecar
+    # was down whose callers may still be waiting; anything older has no
+    # live waiter and would only waste API calls
+    last_id = f"{int((time.time() - WAIT_TIMEOUT_SECONDS) * 1000)}-0"
+
+    print(f"LLM batcher started (batch size {BATCH_MAX_SIZE}, window {BATCH_WINDOW_MS} ms)")
+
+    while True:
+        # Liveness beacon: submitters bypass the stream while it is absent
+        try:
+            r.setex(HEARTBEAT_KEY, HEARTBEAT_TTL_SECONDS, 1)
+        except redis.RedisError:
+            pass
+
+        # Blocking reads run in a thread so the fan-out stays async
+        entries = await asyncio.to_thread(
+            r.xread, {PENDING_STREAM: last_id}, count=BATCH_MAX_SIZE, block=1000
+        )
+        if not entries:
+            continue
+
+        batch = entries[0][1]
+        last_id = batch[-1][0]
+
+        # Let the micro-batch window fill before dispatching
+        if len(batch) < BATCH_MAX_SIZE:
+            more = await asyncio.to_thread(
+                r.xread, {PENDING_STREAM: last_id},
+                count=BATCH_MAX_SIZE - len(batch), block=BATCH_WINDOW_MS
+            )
+            if more:
+                batch += more[0][1]
+                last_id = batch[-1][0]
+
+        await asyncio.gather(*[_complete_one(client, r, fields) for _, fields in batch])
+
+
+if __name__ == "__main__":
+    asyncio.run(run_batcher())
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import redis
+import redis.asyncio
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Cached responses expire after an hour, matching the Celery result expiry
+CACHE_TTL_SECONDS = 3600
+
+# Completed analyses are reusable for a day when the same report + query
+# comes back
+ANALYSIS_CACHE_TTL_SECONDS = 86400
+
+# How long a singleflight leader may hold the lock before followers give up
+# and call the API themselves
+FLIGHT_LOCK_TTL_SECONDS = 60
+
+_redis_client = None
+_async_redis_client = None
+
+def get_redis_client():
+    """Lazily create a shared Redis client (same instance as the Celery broker)"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+        )
+    return _redis_client
+
+
+def get_async_redis_client():
+    """Async twin of get_redis_client. FastAPI endpoints run on the event
+    loop, where the sync client's socket reads would block every other
+    request, so endpoint-side cache access goes through this one."""
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis.from_url(
+            os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+        )
+    return _async_redis_client
+
+
+def analysis_cache_key(file_hash: str, query: str) -> str:
+    """Cache key for a full analysis result keyed by report content + query"""
+    query_digest = hashlib.sha1(query.strip().lower().encode()).hexdigest()
+    return f"analysis:{file_hash}:{query_digest}"
+
+
+class CachedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI with an exact-match response cache in Redis.
+
+    The cache key is the SHA-256 of the canonical JSON payload
+    (model, messages, temperature), so identical calls - repeated queries,
+    re-runs of the same report - skip the OpenAI API entirely.
+    Caching only applies at temperature 0, where responses are
+    deterministic enough to reuse; higher temperatures bypass the cache.
+    Redis failures fall back to calling the API directly.
+    """
+
+    def _cache_key(self, messages: List[BaseMessage]) -> str:
+        payload = {
+            "model": self.model_name,
+            "messages": [m.dict() for m in messages],
+            "temperature": self.temperature,
+        }
+        digest = hashlib.sha256(
+            json.dumps(payload, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"llm_cache:{digest}"
+
+    def _cache_enabled(self) -> bool:
+        return not self.temperature or self.temperature == 0
+
+    def _get_cached(self, key: str) -> Optional[ChatResult]:
+        try:
+            cached = get_redis_client().get(key)
+        except redis.RedisError as e:
+            print(f"LLM cache unavailable, calling API directly: {e}")
+            return None
+
+        if not cached:
+            return None
+
+        data = json.loads(cached)
+        generations = [
+            ChatGeneration(message=AIMessage(content=g["content"]))
+            for g in data["generations"]
+        ]
+        return ChatResult(generations=generations)
+
+    def _store_result(self, key: str, result: ChatResult) -> None:
+        data = {
+            "generations": [
+                {"content": g.message.content} for g in result.generations
+            ]
+        }
+        try:
+            get_redis_client().setex(key, CACHE_TTL_SECONDS, json.dumps(data))
+        except redis.RedisError as e:
+            print(f"Could not store LLM response in cache: {e}")
+
+    # Singleflight: when several workers miss the cache on the same key at
+    # the same moment, only the lock holder calls OpenAI; the rest wait for
+    # its result to land in the cache.
+
+    def _begin_flight(self, key: str) -> bool:
+        """True if this caller should make the API call itself"""
+        try:
+            return bool(get_redis_client().set(
+                f"flight:{key}", 1, nx=True, ex=FLIGHT_LOCK_TTL_SECONDS
+            ))
+        except redis.RedisError:
+            return True
+
+    def _end_flight(self, key: str) -> None:
+        try:
+            pipe = get_redis_client().pipeline()
+            pipe.delete(f"flight:{key}")
+            pipe.publish(f"ready:{key}", "done")
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def _await_flight(self, key: str) -> Optional[ChatResult]:
+        """Wait for the in-flight identical call elsewhere to finish,
+        re-checking the cache as we go; None means call the API ourselves"""
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(f"ready:{key}")
+            try:
+                deadline = time.monotonic() + FLIGHT_LOCK_TTL_SECONDS
+                while time.monotonic() < deadline:
+                    message = pubsub.get_message(timeout=1.0)
+                    cached = self._get_cached(key)
+                    if cached is not None:
+                        return cached
+                    if message:
+                        # Leader finished but nothing cached - fall through
+                        return None
+            finally:
+                pubsub.close()
+        except redis.RedisError:
+            pass
+        return None
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if not self._cache_enabled():
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        key = self._cache_key(messages)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        if not self._begin_flight(key):
+            cached = self._await_flight(key)
+            if cached is not None:
+                return cached
+
+        try:
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            self._store_result(key, result)
+        finally:
+            self._end_flight(key)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if not self._cache_enabled():
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        key = self._cache_key(messages)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+
+        if not self._begin_flight(key):
+            cached = await asyncio.to_thread(self._await_flight, key)
+            if cached is not None:
+                return cached
+
+        try:
+            result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            self._store_result(key, result)
+        finally:
+            self._end_flight(key)
+        return result
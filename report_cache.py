@@ -0,0 +1,54 @@
+import hashlib
+from typing import Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import redis
+from llm_cache import get_redis_client
+
+# Parsed report text and verification results are tied to the file content,
+# so they stay valid as long as the analysis result cache (24 h)
+REPORT_CACHE_TTL_SECONDS = 86400
+
+
+def file_content_hash(file_path: str) -> str:
+    """SHA-256 of the file contents, streamed in 1 MB chunks"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _get(key: str) -> Optional[str]:
+    try:
+        value = get_redis_client().get(key)
+    except redis.RedisError:
+        return None
+    return value.decode() if value is not None else None
+
+
+def _store(key: str, value: str) -> None:
+    try:
+        get_redis_client().setex(key, REPORT_CACHE_TTL_SECONDS, value)
+    except redis.RedisError:
+        pass
+
+
+def get_parsed_text(file_hash: str) -> Optional[str]:
+    """Extracted PDF text from a previous run of the same file, if any"""
+    return _get(f"parsed:{file_hash}")
+
+
+def store_parsed_text(file_hash: str, text: str) -> None:
+    _store(f"parsed:{file_hash}", text)
+
+
+def get_verification(file_hash: str) -> Optional[str]:
+    """Verifier agent output from a previous run of the same file, if any"""
+    return _get(f"verified:{file_hash}")
+
+
+def store_verification(file_hash: str, text: str) -> None:
+    _store(f"verified:{file_hash}", text)
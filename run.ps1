@@ -45,7 +45,7 @@ if ($LASTEXITCODE -ne 0) {
 
 # Install packages that might not be available in conda-forge using pip
 Write-Host "Installing additional packages with pip..." -ForegroundColor Yellow
-pip install crewai crewai-tools PyPDF2 langchain-community openai celery chromadb
+pip install crewai crewai-tools pypdfium2 langchain-community openai celery chromadb
 if ($LASTEXITCODE -ne 0) {
     Write-Host "Error installing pip packages" -ForegroundColor Red
     Read-Host "Press Enter to exit"
@@ -63,15 +63,20 @@ try {
 
 Write-Host ""
 Write-Host "========================================" -ForegroundColor Cyan
-Write-Host "Starting Celery Worker..." -ForegroundColor Green
-Write-Host "Worker will process async analysis tasks" -ForegroundColor Cyan
-Write-Host "Press Ctrl+C to stop the worker" -ForegroundColor Cyan
+Write-Host "Starting Celery Workers..." -ForegroundColor Green
+Write-Host "analyze queue: quick single-report analyses" -ForegroundColor Cyan
+Write-Host "comprehensive queue: long multi-specialist runs" -ForegroundColor Cyan
+Write-Host "Press Ctrl+C to stop the workers" -ForegroundColor Cyan
 Write-Host "========================================" -ForegroundColor Cyan
 Write-Host ""
 
-# Start Celery worker
+# Start Celery workers - one per queue so long comprehensive runs never
+# block short analyses. The analyze worker opens in its own window.
+# The analyze worker uses the solo pool: prefork does not work on Windows,
+# and the shared MEDICAL_CREW is only safe under one-task-at-a-time pools.
 try {
-    celery -A celery_worker worker --loglevel=info --pool=solo
+    Start-Process celery -ArgumentList "-A", "celery_worker", "worker", "-Q", "analyze", "--loglevel=info", "--pool=solo"
+    celery -A celery_worker worker -Q comprehensive --loglevel=info --pool=gevent --concurrency=200
 } catch {
     Write-Host "Error starting Celery worker" -ForegroundColor Red
     Write-Host "Make sure the celery_worker.py file exists and all dependencies are installed" -ForegroundColor Yellow
@@ -1,9 +1,15 @@
 from crewai import Task
-from agents import medical_doctor, verifier_agent, nutrition_specialist, exercise_specialist
+from agents import medical_doctor, medical_doctor_solo, verifier_agent, nutrition_specialist, exercise_specialist
 from tools import blood_test_tool, nutrition_tool, exercise_tool
 
-# Task to verify and read blood test report
-verification_task = Task(
+# The comprehensive pipeline's tasks are created through build_* factories:
+# kickoff interpolates inputs into Task.description and writes Task.output
+# in place, so runs that can overlap in one process (the gevent worker
+# pool, threadpool fan-outs) must each get their own Task instances.
+
+def build_verification_task():
+    """Fresh verification task for one comprehensive run"""
+    return Task(
     description="""
     Verify that the uploaded document is a valid blood test report and extract all relevant information.
     
@@ -17,8 +23,13 @@ verification_task = Task(
     5. Flag any concerns about document authenticity or completeness
     
     Focus on: Laboratory values, reference ranges, test dates, patient information (if present)
+
+    The extracted report text is provided below. Work from it directly and
+    only use the blood_test_report_reader tool as a fallback if the text is
+    missing or unreadable.
     
-    Use the blood_test_report_reader tool with the exact file path provided in the context.
+    Extracted report text:
+    {report_text}
     """,
     expected_output="""
     A comprehensive verification report containing:
@@ -31,11 +42,13 @@ verification_task = Task(
     """,
     agent=verifier_agent,
     tools=[blood_test_tool]
-)
+    )
 
-# Main medical analysis task
-medical_analysis_task = Task(
-    description="""
+verification_task = build_verification_task()
+
+# Main medical analysis task. The description and expected output are shared
+# with the cached-verification variant below.
+MEDICAL_ANALYSIS_DESCRIPTION = """
     Analyze the verified blood test report and provide professional medical insights based on the user's query: {query}
     
     The file path is provided in the context: {file_path}
@@ -53,8 +66,20 @@ medical_analysis_task = Task(
     - Explain medical terms in understandable language
     - Emphasize the importance of healthcare provider consultation
     - Be conservative and safety-focused in recommendations
-    """,
-    expected_output="""
+
+    The extracted report text is provided below. Work from it directly and
+    only use the blood_test_report_reader tool as a fallback if the text is
+    missing or unreadable.
+    
+    Extracted report text:
+    {report_text}
+    
+    Verification summary from a previous analysis of this report, if
+    available (empty on first run):
+    {verification_result}
+    """
+
+MEDICAL_ANALYSIS_EXPECTED_OUTPUT = """
     A comprehensive medical analysis report including:
     - Summary of blood test results with interpretation
     - Identification and explanation of any abnormal values
@@ -64,14 +89,36 @@ medical_analysis_task = Task(
     - Professional recommendations for follow-up care
     - Clear disclaimer about consulting healthcare providers
     - Well-structured, easy-to-understand format
-    """,
-    agent=medical_doctor,
-    tools=[blood_test_tool],
-    context=[verification_task]
-)
+    """
+
+def build_medical_analysis_task(verification):
+    """Fresh medical analysis task fed by this run's verification task"""
+    return Task(
+        description=MEDICAL_ANALYSIS_DESCRIPTION,
+        expected_output=MEDICAL_ANALYSIS_EXPECTED_OUTPUT,
+        agent=medical_doctor,
+        tools=[blood_test_tool],
+        context=[verification]
+    )
+
+def build_medical_analysis_cached_task():
+    """Variant used when the verifier output for this exact file is already
+    cached from an earlier run: same prompt, but no dependency on a fresh
+    verification task execution"""
+    return Task(
+        description=MEDICAL_ANALYSIS_DESCRIPTION,
+        expected_output=MEDICAL_ANALYSIS_EXPECTED_OUTPUT,
+        agent=medical_doctor,
+        tools=[blood_test_tool]
+    )
+
+medical_analysis_task = build_medical_analysis_task(verification_task)
+medical_analysis_cached_task = build_medical_analysis_cached_task()
 
 # Nutrition analysis task
-nutrition_analysis_task = Task(
+def build_nutrition_analysis_task():
+    """Fresh nutrition task for one comprehensive run"""
+    return Task(
     description="""
     Analyze the blood test results and provide evidence-based nutritional recommendations.
     
@@ -82,6 +129,9 @@ nutrition_analysis_task = Task(
     4. Provide specific dietary recommendations based on findings
     5. Suggest appropriate nutritional supplements if indicated
     6. Consider any contraindications or special dietary needs
+    
+    Verified medical analysis of the blood test report:
+    {medical_summary}
     """,
     expected_output="""
     A detailed nutritional analysis containing:
@@ -95,12 +145,15 @@ nutrition_analysis_task = Task(
     - Recommendation to work with registered dietitian
     """,
     agent=nutrition_specialist,
-    tools=[nutrition_tool],
-    context=[verification_task, medical_analysis_task]
-)
+    tools=[nutrition_tool]
+    )
+
+nutrition_analysis_task = build_nutrition_analysis_task()
 
 # Exercise planning task
-exercise_planning_task = Task(
+def build_exercise_planning_task():
+    """Fresh exercise task for one comprehensive run"""
+    return Task(
     description="""
     Develop safe and effective exercise recommendations based on the blood test results and overall health status.
     
@@ -111,6 +164,9 @@ exercise_planning_task = Task(
     4. Consider any contraindications to specific types of exercise
     5. Develop progressive exercise recommendations
     6. Include both cardiovascular and strength training components
+    
+    Verified medical analysis of the blood test report:
+    {medical_summary}
     """,
     expected_output="""
     A comprehensive exercise plan including:
@@ -125,12 +181,15 @@ exercise_planning_task = Task(
     - Emphasis on medical clearance requirements
     """,
     agent=exercise_specialist,
-    tools=[exercise_tool],
-    context=[verification_task, medical_analysis_task]
-)
+    tools=[exercise_tool]
+    )
+
+exercise_planning_task = build_exercise_planning_task()
 
 # Consolidated help task (main task for simple requests)
-help_patients_task = Task(
+def build_help_patients_task():
+    """Fresh help task for one sync analysis run"""
+    return Task(
     description="""
     Provide comprehensive analysis of the blood test report to address the user's query: {query}
     
@@ -150,6 +209,13 @@ help_patients_task = Task(
     - Easy to understand for non-medical users
     - Appropriately cautious with recommendations
     - Encouraging of proper medical follow-up
+
+    The extracted report text is provided below. Work from it directly and
+    only use the blood_test_report_reader tool as a fallback if the text is
+    missing or unreadable.
+    
+    Extracted report text:
+    {report_text}
     """,
     expected_output="""
     A professional medical report containing:
@@ -161,6 +227,8 @@ help_patients_task = Task(
     - Suggestion to consult healthcare providers
     - Well-organized and readable format
     """,
-    agent=medical_doctor,
+    agent=medical_doctor_solo,
     tools=[blood_test_tool]
-)
\ No newline at end of file
+    )
+
+help_patients_task = build_help_patients_task()
\ No newline at end of file
@@ -1,4 +1,8 @@
+import mmap
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,11 +10,89 @@ from crewai.tools import BaseTool
 from crewai_tools import SerperDevTool
 from pydantic import BaseModel, Field
 from typing import Type
-import PyPDF2
+import pypdfium2 as pdfium
 
 # Creating search tool
 search_tool = SerperDevTool()
 
+# Collapses runs of blank lines in one pass
+_NL_RE = re.compile(r"\n{2,}")
+
+
+# Below this page count the thread pool costs more than it saves
+_PARALLEL_PAGE_THRESHOLD = 4
+
+
+def _open_pdf(path: str) -> pdfium.PdfDocument:
+    """Open a PDF through a read-only mmap, so the OS pages the file in on
+    demand and every worker parsing the same file shares the physical pages
+    instead of buffering a private copy."""
+    f = open(path, "rb")
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # e.g. a zero-length file cannot be mapped; let PDFium read it itself
+        f.close()
+        return pdfium.PdfDocument(path)
+    # The mapping keeps the contents accessible after the descriptor closes;
+    # autoclose releases the mapping together with the document
+    f.close()
+    return pdfium.PdfDocument(mm, autoclose=True)
+
+
+def _extract_page_text(path: str, index: int) -> str:
+    """Extract one page. Each worker opens its own document handle because
+    PDFium documents are not safe to share across threads."""
+    pdf = _open_pdf(path)
+    try:
+        page = pdf[index]
+        textpage = page.get_textpage()
+        content = textpage.get_text_range()
+        textpage.close()
+        page.close()
+        return _NL_RE.sub("\n", content)
+    finally:
+        pdf.close()
+
+
+def _extract_pdf_text(path: str) -> str:
+    """Extract and normalize the text of every page in the PDF"""
+    pdf = _open_pdf(path)
+    try:
+        n_pages = len(pdf)
+        if n_pages == 0:
+            return "Error: PDF file appears to be empty (no pages found)"
+
+        if n_pages < _PARALLEL_PAGE_THRESHOLD:
+            parts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                content = textpage.get_text_range()
+                textpage.close()
+                page.close()
+
+                # Clean and format the report data
+                content = _NL_RE.sub("\n", content)
+
+                parts.append(content)
+
+            return "\n".join(parts) + "\n"
+    finally:
+        pdf.close()
+
+    # Larger documents: PDFium releases the GIL during extraction, so pages
+    # parallelize across cores
+    with ThreadPoolExecutor(max_workers=min(n_pages, os.cpu_count() or 1)) as executor:
+        parts = list(executor.map(partial(_extract_page_text, path), range(n_pages)))
+
+    return "\n".join(parts) + "\n"
+
+
+@lru_cache(maxsize=128)
+def _extract_pdf_text_cached(path: str, mtime_ns: int, size: int) -> str:
+    """Memoized extraction; mtime and size key invalidate on file changes"""
+    return _extract_pdf_text(path)
+
 class BloodTestReportInput(BaseModel):
     """Input schema for BloodTestReportTool."""
     path: str = Field(description="Path to the PDF file")
@@ -33,26 +115,18 @@ class BloodTestReportTool(BaseTool):
             if not path:
                 return "Error: No file path provided"
                 
-            if not os.path.exists(path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
                 return f"Error: File not found at path {path}. Please check if the file exists and the path is correct."
-            
-            full_report = ""
-            with open(path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                if len(pdf_reader.pages) == 0:
-                    return "Error: PDF file appears to be empty (no pages found)"
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    content = page.extract_text()
-                    
-                    # Clean and format the report data
-                    while "\n\n" in content:
-                        content = content.replace("\n\n", "\n")
-                    
-                    full_report += content + "\n"
-            
+
+            # Repeat reads of the same unchanged file (e.g. several agents in
+            # one crew run) are served from the in-process cache
+            full_report = _extract_pdf_text_cached(path, st.st_mtime_ns, st.st_size)
+
+            if full_report.startswith("Error:"):
+                return full_report
+
             if not full_report.strip():
                 return "Error: Could not extract text from PDF. The file might be empty, password-protected, or contain only images."
                 
@@ -65,6 +139,47 @@ class BloodTestReportTool(BaseTool):
         except Exception as e:
             return f"Error reading PDF file: {str(e)}"
 
+# Marker keywords are matched in one compiled pass over the report instead
+# of a full-text scan per marker; each keyword maps to a recommendation
+# group so variants like "hgb" and "hemoglobin" collapse to one entry
+def _marker_regex(markers):
+    alternatives = sorted(map(re.escape, markers), key=len, reverse=True)
+    return re.compile("|".join(alternatives), re.IGNORECASE)
+
+
+_NUTRITION_MARKERS = {
+    "hemoglobin": "iron",
+    "hgb": "iron",
+    "vitamin d": "vitamin_d",
+    "cholesterol": "cholesterol",
+    "glucose": "sugar",
+    "sugar": "sugar",
+}
+_NUTRITION_RE = _marker_regex(_NUTRITION_MARKERS)
+
+_NUTRITION_RECOMMENDATIONS = {
+    "iron": "- Monitor iron levels and include iron-rich foods like spinach, lean meats, and legumes",
+    "vitamin_d": "- Consider vitamin D supplementation and foods like fatty fish, fortified milk",
+    "cholesterol": "- Focus on heart-healthy diet with omega-3 rich foods, limit saturated fats",
+    "sugar": "- Monitor carbohydrate intake, choose complex carbs over simple sugars",
+}
+
+_EXERCISE_MARKERS = {
+    "cholesterol": "cholesterol",
+    "glucose": "glucose",
+    "diabetes": "glucose",
+    "blood pressure": "blood_pressure",
+    "hypertension": "blood_pressure",
+}
+_EXERCISE_RE = _marker_regex(_EXERCISE_MARKERS)
+
+_EXERCISE_RECOMMENDATIONS = {
+    "cholesterol": "- Focus on cardiovascular exercises like walking, swimming, or cycling",
+    "glucose": "- Include both aerobic and resistance training to help with glucose control",
+    "blood_pressure": "- Avoid heavy weightlifting, focus on moderate cardio and flexibility exercises",
+}
+
+
 class NutritionAnalysisInput(BaseModel):
     """Input schema for NutritionTool."""
     blood_report_data: str = Field(description="Blood report data to analyze")
@@ -90,22 +205,15 @@ class NutritionTool(BaseTool):
             if not processed_data:
                 return "Error: No blood report data provided for nutrition analysis"
             
-            # Basic nutrition analysis based on common blood markers
-            recommendations = []
-            
-            # Check for common deficiencies
-            if "hemoglobin" in processed_data.lower() or "hgb" in processed_data.lower():
-                recommendations.append("- Monitor iron levels and include iron-rich foods like spinach, lean meats, and legumes")
-            
-            if "vitamin d" in processed_data.lower():
-                recommendations.append("- Consider vitamin D supplementation and foods like fatty fish, fortified milk")
-            
-            if "cholesterol" in processed_data.lower():
-                recommendations.append("- Focus on heart-healthy diet with omega-3 rich foods, limit saturated fats")
-            
-            if "glucose" in processed_data.lower() or "sugar" in processed_data.lower():
-                recommendations.append("- Monitor carbohydrate intake, choose complex carbs over simple sugars")
-            
+            # Basic nutrition analysis based on common blood markers,
+            # detected in a single pass over the report
+            found = {_NUTRITION_MARKERS[m.lower()] for m in _NUTRITION_RE.findall(processed_data)}
+            recommendations = [
+                _NUTRITION_RECOMMENDATIONS[group]
+                for group in ("iron", "vitamin_d", "cholesterol", "sugar")
+                if group in found
+            ]
+
             if not recommendations:
                 recommendations.append("- Maintain a balanced diet with adequate fruits, vegetables, and whole grains")
                 recommendations.append("- Stay hydrated and limit processed foods")
@@ -151,16 +259,15 @@ class ExerciseTool(BaseTool):
             recommendations.append("- Include 2-3 strength training sessions per week")
             recommendations.append("- Begin gradually and increase intensity over time")
             
-            # Specific recommendations based on markers
-            if "cholesterol" in processed_data.lower():
-                recommendations.append("- Focus on cardiovascular exercises like walking, swimming, or cycling")
-            
-            if "glucose" in processed_data.lower() or "diabetes" in processed_data.lower():
-                recommendations.append("- Include both aerobic and resistance training to help with glucose control")
-            
-            if "blood pressure" in processed_data.lower() or "hypertension" in processed_data.lower():
-                recommendations.append("- Avoid heavy weightlifting, focus on moderate cardio and flexibility exercises")
-            
+            # Specific recommendations based on markers, detected in a
+            # single pass over the report
+            found = {_EXERCISE_MARKERS[m.lower()] for m in _EXERCISE_RE.findall(processed_data)}
+            recommendations.extend(
+                _EXERCISE_RECOMMENDATIONS[group]
+                for group in ("cholesterol", "glucose", "blood_pressure")
+                if group in found
+            )
+
             recommendations.append("\nIMPORTANT: Consult with your healthcare provider before starting any new exercise program.")
             
             return "\n".join(recommendations)